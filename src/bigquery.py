@@ -1,17 +1,259 @@
-# TODO(user): Need to provide service account key in "./service_account_key.json"
-
+import asyncio
+import copy
+import datetime
+import decimal
+import functools
 import json
-import pandas_gbq
-from google.api_core.exceptions import BadRequest, NotFound
+import os
+import threading
+import time
+from concurrent import futures
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry as HTTPRetry
+from google.api_core import retry
+from google.api_core.exceptions import BadRequest, Forbidden, NotFound
+from google.auth.transport.requests import AuthorizedSession
 from google.cloud import bigquery
-from collections import OrderedDict
-from google.oauth2 import service_account
+from google.cloud.bigquery.retry import _should_retry as _bigquery_should_retry
+from src.credentials import DEFAULT_KEY_PATH, CLOUD_PLATFORM_SCOPES
+from src.credentials import clear_credentials_cache, get_credentials
 from src.logger import Logger
 
+# orjson is optional, it's only used to speed up parsing of json schema files
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# clients shared across BigQuery instances, {(project_id, id(credentials)):
+# [client, number of open instances using it]}
+_CLIENT_CACHE: dict = {}
+_SESSION_CACHE: dict = {}
+_CACHE_LOCK = threading.Lock()
+
+# how long (in seconds) dataset_exists/table_exists results are reused by default
+_EXISTS_CACHE_TTL = 30
+
+# recently fetched bigquery.Table objects, {full_table_id: (timestamp, table)}
+_TABLE_CACHE: dict = {}
+_TABLE_CACHE_TTL = 300
+_TABLE_CACHE_MAXSIZE = 128
+
+# parsed table schemas, keyed by (schema_json_path, mtime)
+_SCHEMA_CACHE: dict = {}
+
+# limits for insert_many's multi-row INSERT statements, and the number of rows above
+# which a load job is used instead
+_MAX_QUERY_BYTES = 1024 * 1024
+_MAX_QUERY_PARAMETERS = 10000
+_INSERT_MANY_LOAD_JOB_ROWS = 10000
+
+# query parameter types for python values (when there's no table schema to use), and
+# standard SQL names for legacy schema types
+_PARAM_TYPES = {
+    bool: 'BOOL',
+    int: 'INT64',
+    float: 'FLOAT64',
+    str: 'STRING',
+    bytes: 'BYTES',
+    decimal.Decimal: 'NUMERIC',
+    datetime.datetime: 'TIMESTAMP',
+    datetime.date: 'DATE',
+    datetime.time: 'TIME',
+}
+_LEGACY_PARAM_TYPES = {'INTEGER': 'INT64', 'FLOAT': 'FLOAT64', 'BOOLEAN': 'BOOL'}
+
+# largest batch of serialized rows to send per AppendRowsRequest (the request limit
+# is 10 MB, leaving room for the request's other fields)
+_MAX_APPEND_ROWS_BYTES = 9 * 1024 * 1024
+
+# protobuf field types for each BigQuery type, for the Storage Write API (DATE,
+# DATETIME, TIME and NUMERIC values are sent as strings, TIMESTAMP as microseconds
+# since the epoch)
+_PROTO_TYPES = {
+    'STRING': 'TYPE_STRING',
+    'BYTES': 'TYPE_BYTES',
+    'INTEGER': 'TYPE_INT64',
+    'INT64': 'TYPE_INT64',
+    'FLOAT': 'TYPE_DOUBLE',
+    'FLOAT64': 'TYPE_DOUBLE',
+    'BOOLEAN': 'TYPE_BOOL',
+    'BOOL': 'TYPE_BOOL',
+    'NUMERIC': 'TYPE_STRING',
+    'BIGNUMERIC': 'TYPE_STRING',
+    'DATE': 'TYPE_STRING',
+    'DATETIME': 'TYPE_STRING',
+    'TIME': 'TYPE_STRING',
+    'TIMESTAMP': 'TYPE_INT64',
+    'JSON': 'TYPE_STRING',
+    'GEOGRAPHY': 'TYPE_STRING',
+}
+
+# valid query result formats
+_VALID_QUERY_OUTPUTS = frozenset({'dataframe', 'arrow', 'iterator'})
+
+# valid job options (the keys) and their bigquery enums
+_DEST_FORMAT = {
+    'CSV': bigquery.DestinationFormat.CSV,
+    'JSON': bigquery.DestinationFormat.NEWLINE_DELIMITED_JSON,
+    'AVRO': bigquery.DestinationFormat.AVRO,
+    'PARQUET': bigquery.DestinationFormat.PARQUET,
+}
+_EXT_TO_FMT = {
+    'csv': bigquery.DestinationFormat.CSV,
+    'json': bigquery.DestinationFormat.NEWLINE_DELIMITED_JSON,
+    'avro': bigquery.DestinationFormat.AVRO,
+    'parquet': bigquery.DestinationFormat.PARQUET,
+}
+_COMPRESSIONS = {
+    'GZIP': bigquery.Compression.GZIP,
+    'DEFLATE': bigquery.Compression.DEFLATE,
+    'SNAPPY': bigquery.Compression.SNAPPY,
+    'NONE': bigquery.Compression.NONE,
+}
+_DEFAULT_COMPRESSION = {
+    bigquery.DestinationFormat.CSV: 'GZIP',
+    bigquery.DestinationFormat.NEWLINE_DELIMITED_JSON: 'GZIP',
+    bigquery.DestinationFormat.AVRO: 'SNAPPY',
+    bigquery.DestinationFormat.PARQUET: 'SNAPPY',
+}
+_WRITE_DISPOSITION = {
+    'WRITE_TRUNCATE': bigquery.WriteDisposition.WRITE_TRUNCATE,
+    'WRITE_APPEND': bigquery.WriteDisposition.WRITE_APPEND,
+    'WRITE_EMPTY': bigquery.WriteDisposition.WRITE_EMPTY,
+}
+
+# 403 reasons that BigQuery uses for transient rate limit and quota errors
+_RATE_LIMIT_REASONS = frozenset({'rateLimitExceeded', 'quotaExceeded'})
+
+
+def _configure_csv(job_config, max_bad_records):
+    """Set up a load job config for CSV files (with a header row)."""
+
+    job_config.source_format = bigquery.SourceFormat.CSV
+    job_config.skip_leading_rows = 1
+
+
+def _configure_json(job_config, max_bad_records):
+    """Set up a load job config for newline delimited JSON files."""
+
+    job_config.source_format = bigquery.SourceFormat.NEWLINE_DELIMITED_JSON
+    job_config.max_bad_records = max_bad_records
+
+
+def _configure_avro(job_config, max_bad_records):
+    """Set up a load job config for Avro files."""
+
+    job_config.source_format = bigquery.SourceFormat.AVRO
+
+
+def _configure_parquet(job_config, max_bad_records):
+    """Set up a load job config for Parquet files."""
+
+    job_config.source_format = bigquery.SourceFormat.PARQUET
+
+
+# source format specific load job config setup
+_SOURCE_CONFIGURERS = {
+    'CSV': _configure_csv,
+    'JSON': _configure_json,
+    'AVRO': _configure_avro,
+    'PARQUET': _configure_parquet,
+}
+
+
+def _apply_common_job_options(job_config, write_disposition, partition_field,
+                              clustering_fields, relaxed_schema):
+    """
+    Set the options shared by load and query job configs.
+
+    Parameters
+    ----------
+    job_config : google.cloud.bigquery.LoadJobConfig or QueryJobConfig
+        Job config to update
+    write_disposition : str
+        Write disposition (e.g. WRITE_TRUNCATE, WRITE_APPEND, WRITE_EMPTY)
+    partition_field : str
+        Partition field (e.g. "date"), or None
+    clustering_fields : list
+        Clustering fields (e.g. ["date", "user_id"]), or None
+    relaxed_schema : bool
+        Allow field additions and relaxations when appending
+    """
+
+    # set up write disposition for job
+    job_config.write_disposition = _WRITE_DISPOSITION[write_disposition]
+
+    # set up partition field
+    if partition_field:
+        job_config.time_partitioning = bigquery.TimePartitioning(
+            type_=bigquery.TimePartitioningType.DAY,
+            field=partition_field)  # name of column to use for partitioning
+
+    # set up clustering fields
+    if clustering_fields is not None:
+        job_config.clustering_fields = clustering_fields
+
+    # specify schema restrictions
+    if relaxed_schema and write_disposition == 'WRITE_APPEND':
+        job_config.schema_update_options = [
+            bigquery.SchemaUpdateOption.ALLOW_FIELD_ADDITION,
+            bigquery.SchemaUpdateOption.ALLOW_FIELD_RELAXATION,
+        ]
+
+
+@functools.lru_cache(maxsize=32)
+def _get_load_config(source_format, write_disposition, max_bad_records,
+                     partition_field, clustering_fields, relaxed_schema):
+    """
+    Build a template load job config (without a schema) for the given options.
+
+    The template is cached, so it must be copied before it's modified or used
+    (see BigQuery._build_load_job_config). clustering_fields must be a tuple or
+    None so the arguments are hashable.
+    """
+
+    job_config = bigquery.LoadJobConfig()
+
+    # set up job for source format
+    _SOURCE_CONFIGURERS[source_format](job_config, max_bad_records)
+
+    if clustering_fields is not None:
+        clustering_fields = list(clustering_fields)
+    _apply_common_job_options(job_config, write_disposition, partition_field,
+                              clustering_fields, relaxed_schema)
+    return job_config
+
+
+def _is_rate_limited(exc):
+    """Check if an exception is a BigQuery rate limit or quota error."""
+
+    if not isinstance(exc, Forbidden):
+        return False
+    return any(error.get('reason') in _RATE_LIMIT_REASONS for error in exc.errors)
+
+
+def _should_retry(exc):
+    """
+    Check if a failed BigQuery request should be retried.
+
+    Passing a Retry object replaces the library's DEFAULT_RETRY, so this keeps its
+    predicate (transient 5xx, backend and connection errors) and adds rate limit
+    and quota errors.
+    """
+
+    return _bigquery_should_retry(exc) or _is_rate_limited(exc)
+
 
 class BigQuery():
     """Google Cloud BigQuery API helper class"""
 
+    # BigQuery Storage API clients, shared by all instances for reading query results
+    # and writing rows
+    _bqstorage_client = None
+    _bqstorage_write_client = None
+
     def __init__(self, **kwargs):
         """
         Initialize the connection to the database.
@@ -46,75 +288,256 @@ class BigQuery():
         if getattr(self, 'schema_json_path', None):
             self.table_schema = self.get_table_schema()
 
-        # pass service account key into credentials
-        key_path = './service_account_key.json'
-        credentials = service_account.Credentials.from_service_account_file(
-            key_path,
-            scopes=["https://www.googleapis.com/auth/cloud-platform"],
-        )
-        self.client = bigquery.Client(credentials=credentials, project=self.project_id)
+        # pass service account key into credentials (parsed once and shared with the
+        # other helpers), then reuse one client per project and credentials
+        credentials = get_credentials(DEFAULT_KEY_PATH, CLOUD_PLATFORM_SCOPES)
+        with _CACHE_LOCK:
+            session = _SESSION_CACHE.get(id(credentials))
+            if session is None:
+                session = self._build_session(credentials)
+                _SESSION_CACHE[id(credentials)] = session
+            client_key = (self.project_id, id(credentials))
+            if client_key not in _CLIENT_CACHE:
+                client = bigquery.Client(credentials=credentials,
+                                         project=self.project_id,
+                                         _http=session)
+                _CLIENT_CACHE[client_key] = [client, 0]
+            _CLIENT_CACHE[client_key][1] += 1
+            self.client = _CLIENT_CACHE[client_key][0]
+        self.credentials = credentials
 
         # set up logger
         if getattr(self, 'logger', None) is None:
             self.logger = Logger(self.project_id).logger
 
+        # recent dataset_exists/table_exists results, {id: (timestamp, exists)}
+        self._exists_cache = {}
+
+        # retry requests that hit transient errors, rate limits or quotas, backing
+        # off exponentially (with jitter) for up to 10 minutes
+        self._retry = retry.Retry(
+            predicate=_should_retry,
+            initial=1.0,
+            multiplier=2.0,
+            maximum=60.0,
+            deadline=600.0,
+            on_error=self._log_retry,
+        )
+
+    def _log_retry(self, exc):
+        """Log a failed request that is about to be retried."""
+
+        if _is_rate_limited(exc):
+            self.logger.warning(f"Rate limited by BigQuery, retrying: {exc}")
+        else:
+            self.logger.warning(f"BigQuery request failed, retrying: {exc}")
+
+    @staticmethod
+    def _build_session(credentials):
+        """
+        Build an authorized HTTP session with a large connection pool.
+
+        Parameters
+        ----------
+        credentials : google.auth.credentials.Credentials
+            Credentials used to authorize requests
+        """
+
+        # reuse connections across concurrent requests instead of contending on the
+        # default pool, and retry transient server errors at the transport level
+        session = AuthorizedSession(credentials)
+        adapter = HTTPAdapter(
+            pool_connections=64,
+            pool_maxsize=64,
+            # return the last response once retries run out (rather than raising
+            # requests' RetryError), so it still becomes a google.api_core exception
+            max_retries=HTTPRetry(total=5, backoff_factor=0.5,
+                                  status_forcelist=[500, 502, 503, 504],
+                                  raise_on_status=False),
+        )
+        session.mount('https://', adapter)
+        return session
+
+    @classmethod
+    def clear_caches(cls):
+        """Clear the shared credentials and client caches (e.g. for tests)."""
+
+        clear_credentials_cache()
+        with _CACHE_LOCK:
+            _CLIENT_CACHE.clear()
+            _SESSION_CACHE.clear()
+            _TABLE_CACHE.clear()
+            cls._bqstorage_client = None
+            cls._bqstorage_write_client = None
+
+    def _get_bqstorage_client(self):
+        """Get the shared BigQuery Storage API client, creating it if needed."""
+
+        # imported here since it's only needed for reading query results, and it's
+        # slow to import
+        from google.cloud import bigquery_storage
+
+        with _CACHE_LOCK:
+            if BigQuery._bqstorage_client is None:
+                BigQuery._bqstorage_client = bigquery_storage.BigQueryReadClient(
+                    credentials=self.credentials)
+            return BigQuery._bqstorage_client
+
+    def _get_bqstorage_write_client(self):
+        """Get the shared BigQuery Storage Write API client, creating it if needed."""
+
+        from google.cloud import bigquery_storage_v1
+
+        with _CACHE_LOCK:
+            if BigQuery._bqstorage_write_client is None:
+                BigQuery._bqstorage_write_client = bigquery_storage_v1.BigQueryWriteClient(
+                    credentials=self.credentials)
+            return BigQuery._bqstorage_write_client
+
     def get_table_schema(self):
         """Get table schema from json file."""
 
         if self.schema_json_path:
 
-            # load schema from json file
+            # load schema from json file (dicts preserve insertion order), reusing
+            # the parsed schema if the file hasn't changed since it was last read
             try:
-                with open(self.schema_json_path, 'r') as f:
-                    schema = json.load(f, object_pairs_hook=OrderedDict)
+                cache_key = (self.schema_json_path,
+                             os.path.getmtime(self.schema_json_path))
+                if cache_key in _SCHEMA_CACHE:
+                    return _SCHEMA_CACHE[cache_key]
+                if orjson is not None:
+                    with open(self.schema_json_path, 'rb') as f:
+                        schema = orjson.loads(f.read())
+                else:
+                    with open(self.schema_json_path, 'r') as f:
+                        schema = json.load(f)
             except Exception as e:
                 self.logger.error(f"error opening or parsing schema: {e}")
                 raise
 
             # convert to bigquery schema
             if isinstance(schema, list):
-                return schema
+                schema = [bigquery.SchemaField.from_api_repr(field) for field in schema]
             elif isinstance(schema, dict):
-                return [bigquery.SchemaField(k, v) for k, v in schema.items()]
+                schema = [bigquery.SchemaField(k, v) for k, v in schema.items()]
+            _SCHEMA_CACHE[cache_key] = schema
+            return schema
+
+    def _cache_table(self, table_id, table):
+        """Add a fetched table to the shared table cache."""
+
+        with _CACHE_LOCK:
+            _TABLE_CACHE.pop(table_id, None)
+            _TABLE_CACHE[table_id] = (time.monotonic(), table)
+            if len(_TABLE_CACHE) > _TABLE_CACHE_MAXSIZE:
+                del _TABLE_CACHE[next(iter(_TABLE_CACHE))]  # evict the oldest entry
+
+    def _invalidate_table(self, table_id=None):
+        """Drop a table (by default the current table) from the shared table cache."""
+
+        with _CACHE_LOCK:
+            _TABLE_CACHE.pop(table_id or self.full_table_id, None)
+
+    def _get_table_cached(self):
+        """Get the current table, reusing a copy fetched in the last 5 minutes."""
+
+        table_id = self.full_table_id
+        with _CACHE_LOCK:
+            cached = _TABLE_CACHE.get(table_id)
+        if cached is not None and time.monotonic() - cached[0] < _TABLE_CACHE_TTL:
+            return cached[1]
+        table = self.client.get_table(table_id)
+        self._cache_table(table_id, table)
+        return table
+
+    def _get_cached_exists(self, resource_id, max_age):
+        """Get a recent existence check result, or None if there isn't one."""
+
+        cached = self._exists_cache.get(resource_id)
+        if cached is not None and time.monotonic() - cached[0] < max_age:
+            return cached[1]
+
+    def _set_cached_exists(self, resource_id, exists):
+        """Record the result of an existence check (or a create/delete)."""
 
-    def dataset_exists(self):
-        """Check if dataset exists."""
+        self._exists_cache[resource_id] = (time.monotonic(), exists)
+
+    def dataset_exists(self, max_age=_EXISTS_CACHE_TTL):
+        """
+        Check if dataset exists.
+
+        This is meant for user-facing checks, the create methods don't need to be
+        guarded by it since they already handle existing datasets/tables.
+
+        Parameters
+        ----------
+        max_age : float, optional (default: 30)
+            Reuse the result of a check made within the last max_age seconds rather
+            than making another request. Pass 0 to always make a request.
+        """
 
         dataset_id = self.full_dataset_id
-        try:
-            self.client.get_dataset(dataset_id)
+        exists = self._get_cached_exists(dataset_id, max_age)
+        if exists is None:
+            try:
+                self.client.get_dataset(dataset_id)
+                exists = True
+            except NotFound:
+                exists = False
+            self._set_cached_exists(dataset_id, exists)
+        if exists:
             self.logger.info(f"Dataset {dataset_id} exists")
-            return True
-        except NotFound:
+        else:
             self.logger.info(f"Dataset {dataset_id} is not found")
-            return False
+        return exists
+
+    def table_exists(self, max_age=_EXISTS_CACHE_TTL):
+        """
+        Check if table exists.
 
-    def table_exists(self):
-        """Check if table exists."""
+        This is meant for user-facing checks, the create methods don't need to be
+        guarded by it since they already handle existing datasets/tables.
+
+        Parameters
+        ----------
+        max_age : float, optional (default: 30)
+            Reuse the result of a check made within the last max_age seconds rather
+            than making another request. Pass 0 to always make a request.
+        """
 
         table_id = self.full_table_id
-        try:
-            self.client.get_table(table_id)
+        exists = self._get_cached_exists(table_id, max_age)
+        if exists is None:
+            try:
+                self._cache_table(table_id, self.client.get_table(table_id))
+                exists = True
+            except NotFound:
+                self._invalidate_table(table_id)
+                exists = False
+            self._set_cached_exists(table_id, exists)
+        if exists:
             self.logger.info(f"Table {table_id} exists")
-            return True
-        except NotFound:
+        else:
             self.logger.info(f"Table {table_id} is not found")
-            return False
+        return exists
 
-    def create_dataset(self, exists_ok=False):
+    def create_dataset(self, exists_ok=True):
         """
         Create a dataset if it doesn't already exist.
 
         Parameters
         ----------
-        exists_ok : bool, optional
+        exists_ok : bool, optional (default: True)
             If True, do not raise an error if the dataset already exists.
         """
 
         dataset_id = self.full_dataset_id
         dataset = bigquery.Dataset(dataset_id)
         dataset.location = self.location
-        dataset = self.client.create_dataset(dataset, exists_ok=exists_ok, timeout=30)
+        dataset = self.client.create_dataset(
+            dataset, exists_ok=exists_ok, retry=self._retry, timeout=30)
+        self._set_cached_exists(dataset_id, True)
         self.logger.info(f"Created dataset {dataset_id}")
 
     def delete_dataset(self):
@@ -123,11 +546,16 @@ class BigQuery():
         self.client.delete_dataset(
             self.full_dataset_id, delete_contents=True, not_found_ok=True
         )
+        self._exists_cache.clear()  # tables in the dataset are gone too
+        with _CACHE_LOCK:
+            prefix = f"{self.full_dataset_id}."
+            for table_id in [t for t in _TABLE_CACHE if t.startswith(prefix)]:
+                del _TABLE_CACHE[table_id]
         self.logger.info(f"Deleted dataset '{self.dataset_id}'.")
 
-    def create_table(self, partition_field=None, clustering_fields=None):
+    def create_table(self, partition_field=None, clustering_fields=None, exists_ok=True):
         """
-        create a table.
+        create a table if it doesn't already exist.
 
         Parameters
         ----------
@@ -135,12 +563,10 @@ class BigQuery():
             Partition field (e.g. "date")
         clustering_fields : list, optional
             Clustering fields (e.g. ["date", "user_id"])
+        exists_ok : bool, optional (default: True)
+            If True, do not raise an error if the table already exists.
         """
 
-        # confirm table doesn't already exist
-        if self.table_exists():
-            return
-
         # confirm schema exists
         if not getattr(self, 'table_schema', None):
             self.logger.error("No table_schema provided")
@@ -159,18 +585,23 @@ class BigQuery():
                 type_=bigquery.TimePartitioningType.DAY,
                 field=partition_field)  # name of column to use for partitioning
 
-        # create tabe
-        table = self.client.create_table(table, timeout=30)
-        self.logger.info(f"Created table {self.full_table_id}")
+        # create table (the create call itself handles the table already existing)
+        table = self.client.create_table(
+            table, exists_ok=exists_ok, retry=self._retry, timeout=30)
+        self._set_cached_exists(self.full_table_id, True)
+        self._cache_table(self.full_table_id, table)
+        self.logger.info(f"Created table {self.full_table_id} (created at {table.created})")
 
     def delete_table(self):
         """Delete a table."""
 
         table_id = self.full_table_id
         self.client.delete_table(table_id, not_found_ok=True)
+        self._set_cached_exists(table_id, False)
+        self._invalidate_table(table_id)
         self.logger.info(f"Deleted table '{table_id}'.")
 
-    def copy_table(self, dest_table, dest_dataset=None):
+    def copy_table(self, dest_table, dest_dataset=None, wait=True):
         """
         Copy a table.
 
@@ -180,23 +611,115 @@ class BigQuery():
             Destination table name
         dest_dataset : str, optional
             Destination dataset name
+        wait : bool, optional (default: True)
+            Wait for the copy job to complete. If False, the job is returned as
+            soon as it is submitted so the caller can wait on several jobs at once.
+
+        Returns
+        -------
+        google.cloud.bigquery.CopyJob
+            The submitted copy job.
         """
 
         if dest_dataset is None:
             dest_dataset = self.dataset_id
         dest_table_id = f"{self.project_id}.{dest_dataset}.{dest_table}"
         self.logger.info(f"copying table {self.full_table_id} into {dest_table_id}.")
-        job = self.client.copy_table(self.full_table_id, dest_table_id)
+        job = self.client.copy_table(
+            self.full_table_id, dest_table_id, retry=self._retry)
+        if not wait:
+            return job
         job.result()  # Wait for the job to complete.
         self.logger.info(f"{self.full_table_id} was copied into {dest_table_id}.")
+        return job
 
     def close(self):
-        """Close the client connection."""
+        """
+        Close the client connection.
+
+        The client is shared by all BigQuery instances with the same project, so it's
+        only closed once every instance using it has been closed.
+        """
 
+        with _CACHE_LOCK:
+            client_key = (self.project_id, id(self.credentials))
+            cached = _CLIENT_CACHE.get(client_key)
+            if cached is not None and cached[0] is self.client:
+                cached[1] -= 1
+                if cached[1] > 0:
+                    self.logger.info("Client connection released")
+                    return True
+                del _CLIENT_CACHE[client_key]
         self.client.close()
         self.logger.info("Client connection closed")
         return True
 
+    def _build_load_job_config(self, source_format, write_disposition, max_bad_records,
+                               partition_field, clustering_fields, relaxed_schema):
+        """
+        Build the job config for a load job.
+
+        Parameters
+        ----------
+        source_format : str
+            Source format (e.g. CSV, JSON, AVRO, PARQUET)
+        write_disposition : str
+            Write disposition (e.g. WRITE_TRUNCATE, WRITE_APPEND, WRITE_EMPTY)
+        max_bad_records : int
+            The maximum number of bad records that BigQuery can ignore (JSON only)
+        partition_field : str
+            Partition field (e.g. "date"), or None
+        clustering_fields : list
+            Clustering fields (e.g. ["date", "user_id"]), or None
+        relaxed_schema : bool
+            Allow extra values that are not represented in the table schema.
+        """
+
+        # copy the cached template, deep since the config's properties are nested
+        # dicts that would otherwise be shared with the template
+        if clustering_fields is not None:
+            clustering_fields = tuple(clustering_fields)
+        job_config = copy.deepcopy(_get_load_config(
+            source_format, write_disposition, max_bad_records, partition_field,
+            clustering_fields, relaxed_schema))
+
+        # set schema
+        if source_format in {"CSV", "JSON"}:
+            if getattr(self, 'table_schema', None):
+                job_config.schema = self.table_schema
+            else:
+                job_config.autodetect = True
+
+        return job_config
+
+    def _build_query_job_config(self, dest_table_id, write_disposition, partition_field,
+                                clustering_fields, relaxed_schema):
+        """
+        Build the job config for a query job.
+
+        Parameters
+        ----------
+        dest_table_id : str
+            Destination table ID to write query results to, or None to return them
+        write_disposition : str
+            Write disposition for query results
+        partition_field : str
+            Partition field for query results, or None
+        clustering_fields : list
+            Clustering fields for query results, or None
+        relaxed_schema : bool
+            Relax schema restrictions for query results
+        """
+
+        job_config = bigquery.QueryJobConfig()
+        if dest_table_id is not None:
+            table_id = f"{self.project_id}.{self.dataset_id}.{dest_table_id}"
+            job_config.destination = table_id
+            job_config.create_disposition = bigquery.CreateDisposition.CREATE_IF_NEEDED
+            _apply_common_job_options(job_config, write_disposition, partition_field,
+                                      clustering_fields, relaxed_schema)
+        return job_config
+
     def load_from_gcs(self,
                       gcs_uri,
                       source_format='CSV',
@@ -204,14 +727,18 @@ class BigQuery():
                       max_bad_records=0,
                       partition_field=None,
                       clustering_fields=None,
-                      relaxed_schema=False):
+                      relaxed_schema=False,
+                      wait=True):
         """
         Load data from a Google Cloud Storage bucket into a BigQuery table.
 
         Parameters
         ----------
-        gcs_uri : str
-            Google Cloud Storage URI (e.g. gs://my-bucket/file.csv)
+        gcs_uri : str or list of str
+            Google Cloud Storage URI (e.g. gs://my-bucket/file.csv), or a list of
+            URIs. Wildcard URIs (e.g. gs://my-bucket/prefix-*.csv) or lists of URIs
+            are loaded in a single load job, which is preferred over one job per
+            file since it uses one job submission and one load job quota unit.
         source_format : str, optional (default: 'CSV')
             Source format (e.g. CSV, NEWLINE_DELIMITED_JSON, AVRO, PARQUET)
         write_disposition : str, optional (default: 'WRITE_TRUNCATE')
@@ -225,81 +752,55 @@ class BigQuery():
             Clustering fields (e.g. ["date", "user_id"])
         relaxed_schema : bool, optional (default: False)
             Allow extra values that are not represented in the table schema.
+        wait : bool, optional (default: True)
+            Wait for the load job to complete. If False, the job is returned as
+            soon as it is submitted so the caller can wait on several jobs at once.
+
+        Returns
+        -------
+        google.cloud.bigquery.LoadJob
+            The submitted load job.
         """
 
         # check for valid inputs
-        source_format = source_format.upper()
-        assert source_format in ['CSV', 'JSON', 'AVRO'], \
-            "source_format must be one of 'CSV', 'JSON', 'AVRO'"
-        write_disposition = write_disposition.upper()
-        assert write_disposition in ['WRITE_TRUNCATE', 'WRITE_APPEND', 'WRITE_EMPTY'], \
-            "write_disposition must be 'WRITE_TRUNCATE', 'WRITE_APPEND', or 'WRITE_EMPTY'"
+        if not source_format.isupper():
+            source_format = source_format.upper()
+        if source_format not in _SOURCE_CONFIGURERS:
+            raise ValueError("source_format must be one of 'CSV', 'JSON', 'AVRO', 'PARQUET'")
+        if not write_disposition.isupper():
+            write_disposition = write_disposition.upper()
+        if write_disposition not in _WRITE_DISPOSITION:
+            raise ValueError(
+                "write_disposition must be 'WRITE_TRUNCATE', 'WRITE_APPEND', or 'WRITE_EMPTY'")
         if clustering_fields is not None:
-            assert isinstance(clustering_fields, list), \
-                "clustering_fields must be None or a list of strings"
+            if not isinstance(clustering_fields, list):
+                raise ValueError("clustering_fields must be None or a list of strings")
 
         # set up job config
-        job_config = bigquery.LoadJobConfig()
-
-        # set up job for source format
-        if source_format == "CSV":
-            job_config.source_format = bigquery.SourceFormat.CSV
-            job_config.skip_leading_rows = 1
-        elif source_format == "JSON":
-            job_config.source_format = bigquery.SourceFormat.NEWLINE_DELIMITED_JSON
-            job_config.max_bad_records = max_bad_records
-        elif source_format == "AVRO":
-            job_config.source_format = bigquery.SourceFormat.AVRO
-        elif source_format == "PARQUET":
-            job_config.source_format = bigquery.SourceFormat.PARQUET
-
-        # set schema
-        if source_format in {"CSV", "JSON"}:
-            if getattr(self, 'table_schema', None):
-                job_config.schema = self.table_schema
-            else:
-                job_config.autodetect = True
-
-        # set up write disposition for job
-        job_config.write_disposition = {
-            'WRITE_TRUNCATE': bigquery.WriteDisposition.WRITE_TRUNCATE,
-            'WRITE_APPEND': bigquery.WriteDisposition.WRITE_APPEND,
-            'WRITE_EMPTY': bigquery.WriteDisposition.WRITE_EMPTY,
-        }[write_disposition]
-
-        # set up partition field
-        if partition_field:
-            job_config.time_partitioning = bigquery.TimePartitioning(
-                type_=bigquery.TimePartitioningType.DAY,
-                field=partition_field)  # name of column to use for partitioning
-
-        # set up clustering fields
-        if clustering_fields is not None:
-            job_config.clustering_fields = clustering_fields
-
-        # specify schema restrictions
-        if relaxed_schema and write_disposition == 'WRITE_APPEND':
-            job_config.schema_update_options = [
-                bigquery.SchemaUpdateOption.ALLOW_FIELD_ADDITION,
-                bigquery.SchemaUpdateOption.ALLOW_FIELD_RELAXATION,
-            ]
+        job_config = self._build_load_job_config(
+            source_format, write_disposition, max_bad_records, partition_field,
+            clustering_fields, relaxed_schema)
 
         # load data from gcs
         self.logger.info(f"Loading data from {gcs_uri} into {self.full_table_id}")
         load_job = self.client.load_table_from_uri(
-            gcs_uri, self.full_table_id, job_config=job_config)
+            gcs_uri, self.full_table_id, job_config=job_config, retry=self._retry)
 
         # wait for job to complete
+        if not wait:
+            return load_job
         try:
             load_job.result()
         except BadRequest as e:
             for error in e.errors:
                 self.logger.error(error)
             raise
-        destination_table = self.client.get_table(self.full_table_id)
-        self.logger.info(f"{destination_table.num_rows} rows in {self.full_table_id}.")
+        self._invalidate_table()  # the load may have changed the schema
+        self.logger.info(f"{load_job.output_rows} rows loaded into {self.full_table_id}.")
+        return load_job
 
-    def extract_to_gcs(self, gcs_uri, dest_format=None):
+    def extract_to_gcs(self, gcs_uri, dest_format=None, wait=True, compression=None,
+                       field_delimiter=None):
         """
         Extract data from a BigQuery table into a Google Cloud Storage bucket.
 
@@ -309,8 +810,22 @@ class BigQuery():
             Google Cloud Storage URI (e.g. gs://my-bucket/files_*.csv)
         dest_format : str, optional (default: None)
             Destination format (e.g. CSV, NEWLINE_DELIMITED_JSON, AVRO, PARQUET).
-            If not passed, format is inferred from file extension if possible,
-            otherwise CSV is used.
+            If not passed, format is inferred from file extension if possible
+            (ignoring a ".gz" suffix), otherwise CSV is used.
+        wait : bool, optional (default: True)
+            Wait for the extract job to complete. If False, the job is returned as
+            soon as it is submitted so the caller can wait on several jobs at once.
+        compression : str, optional (default: None)
+            Compression of the extracted files (GZIP, DEFLATE, SNAPPY or NONE).
+            If not passed, CSV and JSON files are compressed with GZIP and AVRO
+            and PARQUET files with SNAPPY. Pass 'NONE' for uncompressed files.
+        field_delimiter : str, optional (default: None)
+            Field delimiter for CSV files (e.g. "\t"). If not passed, "," is used.
+
+        Returns
+        -------
+        google.cloud.bigquery.ExtractJob
+            The submitted extract job.
         """
 
         job_config = bigquery.ExtractJobConfig()
@@ -319,36 +834,158 @@ class BigQuery():
         if dest_format is not None:
             dest_format = dest_format.upper()
             try:
-                job_config.destination_format = {
-                    'CSV': bigquery.DestinationFormat.CSV,
-                    'JSON': bigquery.DestinationFormat.NEWLINE_DELIMITED_JSON,
-                    'AVRO': bigquery.DestinationFormat.AVRO,
-                    'PARQUET': bigquery.DestinationFormat.PARQUET,
-                }[dest_format]
+                job_config.destination_format = _DEST_FORMAT[dest_format]
             except KeyError:
                 raise ValueError("dest_format must be one of None, \
                     'CSV', 'JSON', 'AVRO', or 'PARQUET'")
         else:
-            if gcs_uri.upper().endswith('.JSON'):
-                job_config.destination_format = \
-                    bigquery.DestinationFormat.NEWLINE_DELIMITED_JSON
-            elif gcs_uri.upper().endswith('.AVRO'):
-                job_config.destination_format = bigquery.DestinationFormat.AVRO
-            elif gcs_uri.upper().endswith('.PARQUET'):
-                job_config.destination_format = bigquery.DestinationFormat.PARQUET
-            else:
-                job_config.destination_format = bigquery.DestinationFormat.CSV
+            # look at the file name only (bucket names can contain dots), ignoring a
+            # compression suffix (e.g. "files_*.json.gz")
+            name = gcs_uri.rpartition('/')[2].lower()
+            if name.endswith('.gz'):
+                name = name[:-3]
+            ext = name.rpartition('.')[2]
+            job_config.destination_format = _EXT_TO_FMT.get(
+                ext, bigquery.DestinationFormat.CSV)
+
+        # set up compression (to reduce bytes written to and later read from gcs)
+        if compression is None:
+            compression = _DEFAULT_COMPRESSION[job_config.destination_format]
+        compression = compression.upper()
+        if compression not in _COMPRESSIONS:
+            raise ValueError("compression must be one of None, 'GZIP', 'DEFLATE', "
+                             "'SNAPPY', or 'NONE'")
+        job_config.compression = _COMPRESSIONS[compression]
+        if field_delimiter is not None:
+            job_config.field_delimiter = field_delimiter
 
         # extract data to gcs
         self.logger.info(f"Extracting data from {self.full_table_id} into {gcs_uri}.")
         extract_job = self.client.extract_table(
-            self.full_table_id, gcs_uri, location=self.location, job_config=job_config)
+            self.full_table_id, gcs_uri, location=self.location, job_config=job_config,
+            retry=self._retry)
 
         # wait for job to complete
+        if not wait:
+            return extract_job
         extract_job.result()
         self.logger.info(f"Data extracted from {self.full_table_id} into {gcs_uri}.")
+        return extract_job
+
+    def load_from_gcs_parallel(self, gcs_uris, write_disposition='WRITE_TRUNCATE',
+                               max_workers=8, **kwargs):
+        """
+        Load data from many Google Cloud Storage URIs into the table with concurrent
+        load jobs.
+
+        If write_disposition is 'WRITE_TRUNCATE' (or 'WRITE_EMPTY'), the first URI is
+        loaded on its own with that disposition, then the rest are appended in
+        parallel. Errors are raised as soon as any job fails; loads that haven't
+        started yet are then skipped, but jobs already submitted keep running.
+
+        Parameters
+        ----------
+        gcs_uris : list of str
+            Google Cloud Storage URIs (e.g. ["gs://my-bucket/file1.csv", ...])
+        write_disposition : str, optional (default: 'WRITE_TRUNCATE')
+            Write disposition (e.g. WRITE_TRUNCATE, WRITE_APPEND, WRITE_EMPTY)
+        max_workers : int, optional (default: 8)
+            Maximum number of load jobs to run at once (bounded to stay well within
+            load job quotas)
+        **kwargs
+            Other load_from_gcs arguments (e.g. source_format, partition_field)
+
+        Returns
+        -------
+        list of google.cloud.bigquery.LoadJob
+            The completed load jobs, in the same order as `gcs_uris`.
+
+        Notes:
+        ------
+        A single load_from_gcs call with a list of URIs is usually preferable, since
+        BigQuery parallelizes reading the files of one job. Use this when a single
+        job is throughput-limited.
+        """
+
+        gcs_uris = list(gcs_uris)
+        if not gcs_uris:
+            return []
+
+        # load the first uri on its own if it needs to truncate (or check) the table
+        jobs = []
+        if write_disposition.upper() != 'WRITE_APPEND':
+            jobs.append(self.load_from_gcs(
+                gcs_uris[0], write_disposition=write_disposition, **kwargs))
+            gcs_uris = gcs_uris[1:]
+
+        # append the rest concurrently
+        executor = futures.ThreadPoolExecutor(max_workers=max_workers)
+        pending = [executor.submit(self.load_from_gcs, gcs_uri,
+                                   write_disposition='WRITE_APPEND', **kwargs)
+                   for gcs_uri in gcs_uris]
+        try:
+            for future in futures.as_completed(pending):
+                future.result()  # raise errors early
+        except BaseException:
+            # don't wait for the other loads (or start the queued ones) before raising
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        executor.shutdown()
+        return jobs + [future.result() for future in pending]
+
+    def load_from_gcs_many(self, loads):
+        """
+        Load data from several Google Cloud Storage URIs into BigQuery tables.
+
+        All load jobs are submitted up front and then waited on together, so the
+        BigQuery scheduling latency of each job overlaps with the others instead
+        of being paid one job at a time.
+
+        Parameters
+        ----------
+        loads : list of tuple
+            (gcs_uri, table_id, job_config) tuples, where gcs_uri is a URI or list
+            of URIs (see load_from_gcs), table_id is the table name within the
+            current dataset (e.g. "my_table") and job_config is a
+            google.cloud.bigquery.LoadJobConfig (or None for the client default).
+
+        Returns
+        -------
+        list of google.cloud.bigquery.LoadJob
+            The completed load jobs, in the same order as `loads`.
+        """
 
-    def load_from_dataframe(self, df):
+        # submit all jobs before waiting on any of them
+        jobs = []
+        for gcs_uri, table_id, job_config in loads:
+            full_table_id = f"{self.project_id}.{self.dataset_id}.{table_id}"
+            self.logger.info(f"Loading data from {gcs_uri} into {full_table_id}")
+            jobs.append(self.client.load_table_from_uri(
+                gcs_uri, full_table_id, job_config=job_config, retry=self._retry))
+        if not jobs:
+            return jobs
+
+        # reap jobs as they complete
+        errors = []
+        with futures.ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+            pending = {executor.submit(job.result): job for job in jobs}
+            for future in futures.as_completed(pending):
+                job = pending[future]
+                table_id = f"{job.destination.dataset_id}.{job.destination.table_id}"
+                try:
+                    future.result()
+                except BadRequest as e:
+                    for error in e.errors:
+                        self.logger.error(error)
+                    errors.append(e)
+                    continue
+                self._invalidate_table(str(job.destination))
+                self.logger.info(f"{job.output_rows} rows loaded into {table_id}.")
+        if errors:
+            raise errors[0]
+        return jobs
+
+    def load_from_dataframe(self, df, write_disposition='WRITE_APPEND', use_streaming=False):
         """
         Load data from a pandas DataFrame into a BigQuery table.
 
@@ -356,23 +993,345 @@ class BigQuery():
         ----------
         df : pandas.DataFrame
             DataFrame to load into BigQuery
+        write_disposition : str, optional (default: 'WRITE_APPEND')
+            Write disposition (e.g. WRITE_TRUNCATE, WRITE_APPEND, WRITE_EMPTY).
+            Ignored when use_streaming=True, since streamed rows are always appended.
+        use_streaming : bool, optional (default: False)
+            Append rows with streaming inserts (in chunks of 500 rows) instead of a
+            load job. Useful for frequent small pushes, since load jobs are limited
+            to 1500 per table per day.
+
+        Returns
+        -------
+        list
+            Streaming insert errors, if use_streaming=True (otherwise None).
 
         Notes:
         ------
-        This method is not recommended for large dataframes. For large dataframes,
-        use the load_from_gcs method instead.
-
-        This method will raise an exception if the table already exists, although
-        this can be changed.
+        The DataFrame is serialized to Parquet (via pyarrow) and loaded with a single
+        load job. For very large dataframes, consider writing them to GCS and using
+        the load_from_gcs method instead.
         """
 
+        # stream small pushes rather than using up load jobs
+        if use_streaming:
+            self.logger.info(f"Streaming data from dataframe into {self.full_table_id}...")
+            selected_fields = getattr(self, 'table_schema', None)
+            if not selected_fields:
+                selected_fields = self._get_table_cached().schema
+            chunk_errors = self.client.insert_rows_from_dataframe(
+                self.full_table_id, df, selected_fields=selected_fields, chunk_size=500,
+                retry=self._retry)
+            # make each error's "index" relative to the dataframe, not its chunk
+            errors = []
+            for n, chunk in enumerate(chunk_errors):
+                for error in chunk:
+                    error['index'] += n * 500
+                errors += chunk
+            for error in errors:
+                self.logger.error(error)
+            self.logger.info(f"Streamed data from dataframe into {self.full_table_id}")
+            return errors
+
+        # check for valid inputs
+        if not write_disposition.isupper():
+            write_disposition = write_disposition.upper()
+        if write_disposition not in _WRITE_DISPOSITION:
+            raise ValueError(
+                "write_disposition must be 'WRITE_TRUNCATE', 'WRITE_APPEND', or 'WRITE_EMPTY'")
+
+        # set up job config
+        job_config = bigquery.LoadJobConfig(
+            source_format=bigquery.SourceFormat.PARQUET,
+            write_disposition=_WRITE_DISPOSITION[write_disposition],
+        )
+        if getattr(self, 'table_schema', None):
+            job_config.schema = self.table_schema
+
+        # load data from dataframe (with job_config.schema set, the client converts
+        # each column with the table's types rather than inferring them)
         self.logger.info(f"Extracting data from dataframe into {self.full_table_id}...")
-        table_id = f"{self.dataset_id}.{self.table_id}"
-        pandas_gbq.to_gbq(df, table_id, project_id=self.project_id)
+        # load_table_from_dataframe doesn't take a retry argument
+        load_job = self.client.load_table_from_dataframe(
+            df, self.full_table_id, job_config=job_config)
+        load_job.result()
+        self._invalidate_table()  # the load may have changed the schema
         self.logger.info(f"Extracted data from dataframe into {self.full_table_id}")
 
+    def _stream_rows(self, rows, chunk_size=500):
+        """
+        Stream rows into the table with insert_rows_json, chunk_size rows at a time.
+
+        Parameters
+        ----------
+        rows : list of dict
+            JSON-compatible rows to insert
+        chunk_size : int, optional (default: 500)
+            Maximum number of rows per insert request (BigQuery recommends about
+            500, and rejects requests over 50,000 rows)
+
+        Returns
+        -------
+        list of dict
+            Insert errors, with each "index" relative to `rows`.
+        """
+
+        errors = []
+        for i in range(0, len(rows), chunk_size):
+            chunk_errors = self.client.insert_rows_json(
+                self.full_table_id, rows[i:i + chunk_size], retry=self._retry)
+            for error in chunk_errors:
+                error['index'] += i
+            errors += chunk_errors
+        return errors
+
+    def insert_rows(self, rows, chunk_size=500):
+        """
+        Stream rows into a BigQuery table.
+
+        Parameters
+        ----------
+        rows : list of dict
+            JSON-compatible rows to insert (e.g. [{"date": "2022-01-01", "n": 1}])
+        chunk_size : int, optional (default: 500)
+            Maximum number of rows per insert request
+
+        Returns
+        -------
+        list of dict
+            Insert errors, with each "index" relative to `rows`.
+        """
+
+        self.logger.info(f"Streaming {len(rows)} rows into {self.full_table_id}...")
+        errors = self._stream_rows(rows, chunk_size=chunk_size)
+        for error in errors:
+            self.logger.error(error)
+        self.logger.info(f"Streamed {len(rows)} rows into {self.full_table_id}")
+        return errors
+
+    @staticmethod
+    def _query_parameter(field_type, value):
+        """
+        Build a positional query parameter for a value.
+
+        Parameters
+        ----------
+        field_type : str
+            BigQuery type of the column, or None to infer it from the value
+        value : object
+            Parameter value (a list for array parameters)
+        """
+
+        sample = value[0] if isinstance(value, list) and value else value
+        if field_type is None:
+            field_type = _PARAM_TYPES.get(type(sample), 'STRING')
+        field_type = _LEGACY_PARAM_TYPES.get(field_type, field_type)
+        if isinstance(value, list):
+            return bigquery.ArrayQueryParameter(None, field_type, value)
+        return bigquery.ScalarQueryParameter(None, field_type, value)
+
+    def insert_many(self, rows, use_load_job=True):
+        """
+        Insert rows into the table with batched multi-row INSERT statements.
+
+        Rows are inserted with as few parameterized `INSERT ... VALUES (?, ?), ...`
+        queries as BigQuery's query size and parameter limits allow, rather than one
+        query per row.
+
+        Parameters
+        ----------
+        rows : list of dict
+            Rows to insert, all with the same keys (e.g. [{"date": "2022-01-01"}])
+        use_load_job : bool, optional (default: True)
+            Load the rows with a single load job instead, if there are more than
+            10,000 of them. RECORD fields are only supported with a load job.
+        """
+
+        if not rows:
+            return
+        rows = list(rows)
+
+        # use a load job for many rows
+        if use_load_job and len(rows) > _INSERT_MANY_LOAD_JOB_ROWS:
+            self.logger.info(f"Loading {len(rows)} rows into {self.full_table_id}...")
+            job_config = bigquery.LoadJobConfig(
+                source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+                write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+            )
+            if getattr(self, 'table_schema', None):
+                job_config.schema = self.table_schema
+            else:
+                job_config.autodetect = True
+            # load_table_from_json doesn't take a retry argument
+            load_job = self.client.load_table_from_json(
+                rows, self.full_table_id, job_config=job_config)
+            load_job.result()
+            self._invalidate_table()
+            self.logger.info(f"{load_job.output_rows} rows loaded into {self.full_table_id}.")
+            return
+
+        # take parameter types from the table (which has to exist for the insert
+        # anyway) when no table_schema is set, since types inferred from NULLs or
+        # empty lists would be STRING
+        columns = list(rows[0])
+        schema = getattr(self, 'table_schema', None) or self._get_table_cached().schema
+        field_types = {f.name: f.field_type for f in schema}
+        column_types = [field_types.get(column) for column in columns]
+        for column, field_type in zip(columns, column_types):
+            if field_type in ('RECORD', 'STRUCT'):
+                raise ValueError(f"insert_many doesn't support {field_type} fields "
+                                 f"(field {column}) without a load job")
+
+        # build the statement pieces once, and fit as many rows per query as possible
+        prefix = f"INSERT `{self.full_table_id}` ({', '.join(f'`{c}`' for c in columns)}) VALUES "
+        row_sql = f"({', '.join(['?'] * len(columns))})"
+        rows_per_query = max(1, min(_MAX_QUERY_PARAMETERS // len(columns),
+                                    (_MAX_QUERY_BYTES - len(prefix)) // (len(row_sql) + 1)))
+
+        # run one query per chunk of rows
+        self.logger.info(f"Inserting {len(rows)} rows into {self.full_table_id}...")
+        for i in range(0, len(rows), rows_per_query):
+            chunk = rows[i:i + rows_per_query]
+            query = prefix + ",".join([row_sql] * len(chunk))
+            job_config = bigquery.QueryJobConfig(query_parameters=[
+                self._query_parameter(field_type, row.get(column))
+                for row in chunk
+                for column, field_type in zip(columns, column_types)
+            ])
+            self.client.query(query, location=self.location, job_config=job_config,
+                              retry=self._retry).result()
+        self.logger.info(f"Inserted {len(rows)} rows into {self.full_table_id}")
+
+    def _build_row_proto(self):
+        """
+        Build a protobuf message class (and its descriptor) for rows of the table.
+
+        Returns
+        -------
+        tuple
+            (message class, google.protobuf.descriptor_pb2.DescriptorProto)
+        """
+
+        from google.protobuf import descriptor_pb2, descriptor_pool, message_factory
+
+        field_proto = descriptor_pb2.FieldDescriptorProto
+        file_proto = descriptor_pb2.FileDescriptorProto(
+            name=f"{self.table_id}_row.proto", package="gcp_helpers", syntax="proto2")
+        message_proto = file_proto.message_type.add(name="Row")
+        for number, field in enumerate(self.table_schema, start=1):
+            proto_type = _PROTO_TYPES.get(field.field_type)
+            if proto_type is None:
+                raise ValueError(f"storage_write doesn't support {field.field_type} "
+                                 f"fields (field {field.name})")
+            if field.mode == 'REPEATED':
+                label = field_proto.LABEL_REPEATED
+            elif field.mode == 'REQUIRED':
+                label = field_proto.LABEL_REQUIRED
+            else:
+                label = field_proto.LABEL_OPTIONAL
+            message_proto.field.add(name=field.name, number=number, label=label,
+                                    type=getattr(field_proto, proto_type))
+
+        pool = descriptor_pool.DescriptorPool()
+        pool.Add(file_proto)
+        descriptor = pool.FindMessageTypeByName("gcp_helpers.Row")
+        try:
+            row_class = message_factory.GetMessageClass(descriptor)
+        except AttributeError:  # protobuf < 4.21
+            row_class = message_factory.MessageFactory(pool).GetPrototype(descriptor)
+        descriptor_proto = descriptor_pb2.DescriptorProto()
+        descriptor.CopyToProto(descriptor_proto)
+        return row_class, descriptor_proto
+
+    def storage_write(self, rows):
+        """
+        Write rows to the table with the BigQuery Storage Write API.
+
+        Rows are serialized to protobuf (using a message type derived from the table
+        schema) and appended over a single gRPC stream in batches of up to ~10 MB.
+        Without a table schema, falls back to a load job.
+
+        Parameters
+        ----------
+        rows : iterable of dict
+            Rows to write (e.g. [{"date": "2022-01-01", "n": 1}]). TIMESTAMP values
+            must be ints (microseconds since the epoch); DATE, DATETIME, TIME and
+            NUMERIC values must be strings.
+
+        Returns
+        -------
+        int
+            Number of rows written.
+        """
+
+        # fall back to a load job for schemaless data
+        if not getattr(self, 'table_schema', None):
+            rows = list(rows)
+            self.logger.info(f"No table_schema, loading {len(rows)} rows into "
+                             f"{self.full_table_id} with a load job")
+            job_config = bigquery.LoadJobConfig(
+                source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+                write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+                autodetect=True,
+            )
+            self.client.load_table_from_json(
+                rows, self.full_table_id, job_config=job_config).result()
+            self._invalidate_table()
+            return len(rows)
+
+        from google.cloud.bigquery_storage_v1 import types, writer
+
+        row_class, descriptor_proto = self._build_row_proto()
+        write_client = self._get_bqstorage_write_client()
+
+        # open a committed stream, so rows are visible as soon as they're appended
+        parent = write_client.table_path(self.project_id, self.dataset_id, self.table_id)
+        write_stream = write_client.create_write_stream(
+            parent=parent,
+            write_stream=types.WriteStream(type_=types.WriteStream.Type.COMMITTED))
+        request_template = types.AppendRowsRequest(
+            write_stream=write_stream.name,
+            proto_rows=types.AppendRowsRequest.ProtoData(
+                writer_schema=types.ProtoSchema(proto_descriptor=descriptor_proto)),
+        )
+        append_rows_stream = writer.AppendRowsStream(write_client, request_template)
+
+        def send(batch, offset):
+            request = types.AppendRowsRequest(
+                offset=offset,
+                proto_rows=types.AppendRowsRequest.ProtoData(
+                    rows=types.ProtoRows(serialized_rows=batch)),
+            )
+            return append_rows_stream.send(request)
+
+        # serialize rows and send them in batches
+        self.logger.info(f"Writing rows to {self.full_table_id} with the Storage Write API")
+        append_futures = []
+        batch, batch_bytes, offset = [], 0, 0
+        try:
+            for row in rows:
+                data = row_class(**{k: v for k, v in row.items() if v is not None}
+                                 ).SerializeToString()
+                if batch and batch_bytes + len(data) > _MAX_APPEND_ROWS_BYTES:
+                    append_futures.append(send(batch, offset))
+                    offset += len(batch)
+                    batch, batch_bytes = [], 0
+                batch.append(data)
+                batch_bytes += len(data)
+            if batch:
+                append_futures.append(send(batch, offset))
+                offset += len(batch)
+            for future in append_futures:
+                future.result()
+        finally:
+            append_rows_stream.close()
+        write_client.finalize_write_stream(name=write_stream.name)
+        self.logger.info(f"Wrote {offset} rows to {self.full_table_id}")
+        return offset
+
     def query(self, query, dest_table_id=None, write_disposition='WRITE_TRUNCATE',
-              relaxed_schema=False, partition_field=None, clustering_fields=None):
+              relaxed_schema=False, partition_field=None, clustering_fields=None,
+              output='dataframe', wait=True):
         """
         Run a query on a BigQuery table.
 
@@ -390,6 +1349,14 @@ class BigQuery():
             Partition field for query results
         clustering_fields : list, optional (default: None)
             Clustering fields for query results
+        output : str, optional (default: 'dataframe')
+            Format of the results when no dest_table_id is passed. One of
+            'dataframe' (pandas.DataFrame), 'arrow' (pyarrow.Table), or 'iterator'
+            (iterator of pyarrow.RecordBatch, so large results don't have to fit
+            in memory at once). Results are read through the BigQuery Storage API.
+        wait : bool, optional (default: True)
+            Wait for the query to complete. If False, the query job is returned as
+            soon as it is submitted so the caller can wait on several jobs at once.
 
         Notes:
         ------
@@ -400,51 +1367,162 @@ class BigQuery():
         """
 
         # check for valid inputs
-        write_disposition = write_disposition.upper()
-        assert write_disposition in ['WRITE_TRUNCATE', 'WRITE_APPEND', 'WRITE_EMPTY'], \
-            "write_disposition must be 'WRITE_TRUNCATE', 'WRITE_APPEND', or 'WRITE_EMPTY'"
+        if not write_disposition.isupper():
+            write_disposition = write_disposition.upper()
+        if write_disposition not in _WRITE_DISPOSITION:
+            raise ValueError(
+                "write_disposition must be 'WRITE_TRUNCATE', 'WRITE_APPEND', or 'WRITE_EMPTY'")
+        if not output.islower():
+            output = output.lower()
+        if output not in _VALID_QUERY_OUTPUTS:
+            raise ValueError("output must be 'dataframe', 'arrow', or 'iterator'")
 
         # set up job config
-        job_config = bigquery.QueryJobConfig()
+        job_config = self._build_query_job_config(
+            dest_table_id, write_disposition, partition_field, clustering_fields,
+            relaxed_schema)
         if dest_table_id is not None:
             table_id = f"{self.project_id}.{self.dataset_id}.{dest_table_id}"
-            job_config.destination = table_id
-            job_config.create_disposition = bigquery.CreateDisposition.CREATE_IF_NEEDED
 
-            # set up write disposition for job
-            job_config.write_disposition = {
-                'WRITE_TRUNCATE': bigquery.WriteDisposition.WRITE_TRUNCATE,
-                'WRITE_APPEND': bigquery.WriteDisposition.WRITE_APPEND,
-                'WRITE_EMPTY': bigquery.WriteDisposition.WRITE_EMPTY,
-            }[write_disposition]
-
-            # relax schema restrictions
-            if relaxed_schema and write_disposition == 'WRITE_APPEND':
-                job_config.schema_update_options = [
-                    bigquery.SchemaUpdateOption.ALLOW_FIELD_ADDITION,
-                    bigquery.SchemaUpdateOption.ALLOW_FIELD_RELAXATION,
-                ]
-
-            # set up clustering fields
-            if clustering_fields is not None:
-                job_config.clustering_fields = clustering_fields
-
-            # set up partition field
-            if partition_field:
-                job_config.time_partitioning = bigquery.TimePartitioning(
-                    type_=bigquery.TimePartitioningType.DAY,
-                    field=partition_field)  # name of column to use for partitioning
-
-        # when no destination table is specified, then save results in pandas dataframe
+        # when no destination table is specified, then return the results
         else:
-            table_id = "pandas DataFrame"
+            table_id = output
 
-        # run query
+        # run query, submitting it and fetching the first page of results in one
+        # request when the results are returned rather than written to a table
         self.logger.info(f"Running query to destination: {table_id}")
-        if dest_table_id is not None:
-            query_job = self.client.query(
-                query, location=self.location, job_config=job_config)
-            query_job.result()
-        else:
-            return self.client.query(query).to_dataframe()
+        if dest_table_id is None and wait:
+            rows = self.client.query_and_wait(
+                query, location=self.location, job_config=job_config, retry=self._retry)
+            self.logger.info(f"Completed query to destination: {table_id}")
+            return self._convert_rows(rows, output)
+        query_job = self.client.query(
+            query, location=self.location, job_config=job_config, retry=self._retry)
+        if not wait:
+            return query_job
+        query_job.result()
         self.logger.info(f"Completed query to destination: {table_id}")
+        self._invalidate_table(table_id)  # the query may have changed the schema
+
+    def _convert_rows(self, rows, output):
+        """
+        Convert query results to the requested output format.
+
+        Parameters
+        ----------
+        rows : google.cloud.bigquery.table.RowIterator
+            Query results
+        output : str
+            'dataframe', 'arrow', or 'iterator' (see query)
+        """
+
+        if output == 'arrow':
+            return rows.to_arrow(bqstorage_client=self._get_bqstorage_client())
+        if output == 'iterator':
+            return rows.to_arrow_iterable(bqstorage_client=self._get_bqstorage_client())
+        return rows.to_dataframe(bqstorage_client=self._get_bqstorage_client())
+
+    async def _run_in_executor(self, fn, *args, **kwargs):
+        """Run a blocking call in the event loop's default executor."""
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(fn, *args, **kwargs))
+
+    async def wait_for_job_async(self, job, poll_interval=0.5):
+        """
+        Wait for a BigQuery job to complete without blocking the event loop.
+
+        Parameters
+        ----------
+        job : google.cloud.bigquery.job._AsyncJob
+            Submitted job (e.g. from query(..., wait=False))
+        poll_interval : float, optional (default: 0.5)
+            Time in seconds between job status checks
+
+        Returns
+        -------
+        The job's result (e.g. a RowIterator for query jobs).
+        """
+
+        while not await self._run_in_executor(job.done):
+            await asyncio.sleep(poll_interval)
+        return await self._run_in_executor(job.result)
+
+    async def gather_jobs(self, jobs, poll_interval=0.5):
+        """
+        Wait for many BigQuery jobs to complete concurrently.
+
+        Parameters
+        ----------
+        jobs : list of google.cloud.bigquery.job._AsyncJob
+            Submitted jobs
+        poll_interval : float, optional (default: 0.5)
+            Time in seconds between job status checks
+
+        Returns
+        -------
+        list
+            The jobs' results, in the same order as `jobs`.
+        """
+
+        return await asyncio.gather(
+            *(self.wait_for_job_async(job, poll_interval) for job in jobs))
+
+    async def create_dataset_async(self, *args, **kwargs):
+        """Async variant of create_dataset (takes the same arguments)."""
+
+        return await self._run_in_executor(self.create_dataset, *args, **kwargs)
+
+    async def create_table_async(self, *args, **kwargs):
+        """Async variant of create_table (takes the same arguments)."""
+
+        return await self._run_in_executor(self.create_table, *args, **kwargs)
+
+    async def copy_table_async(self, *args, **kwargs):
+        """Async variant of copy_table (takes the same arguments, except wait)."""
+
+        job = await self._run_in_executor(self.copy_table, *args, wait=False, **kwargs)
+        await self.wait_for_job_async(job)
+        self.logger.info(f"{self.full_table_id} was copied into {job.destination}.")
+        return job
+
+    async def extract_to_gcs_async(self, *args, **kwargs):
+        """Async variant of extract_to_gcs (takes the same arguments, except wait)."""
+
+        job = await self._run_in_executor(
+            self.extract_to_gcs, *args, wait=False, **kwargs)
+        await self.wait_for_job_async(job)
+        self.logger.info(f"Data extracted from {self.full_table_id} into "
+                         f"{job.destination_uris}.")
+        return job
+
+    async def load_from_gcs_async(self, *args, **kwargs):
+        """Async variant of load_from_gcs (takes the same arguments, except wait)."""
+
+        job = await self._run_in_executor(self.load_from_gcs, *args, wait=False, **kwargs)
+        try:
+            await self.wait_for_job_async(job)
+        except BadRequest as e:
+            for error in e.errors:
+                self.logger.error(error)
+            raise
+        self._invalidate_table()  # the load may have changed the schema
+        self.logger.info(f"{job.output_rows} rows loaded into {self.full_table_id}.")
+        return job
+
+    async def query_async(self, query, dest_table_id=None, output='dataframe', **kwargs):
+        """
+        Async variant of query (takes the same arguments, except wait).
+
+        Many queries can be run concurrently from one thread, e.g.
+        `await asyncio.gather(*(bq.query_async(q) for q in queries))`.
+        """
+
+        job = await self._run_in_executor(
+            self.query, query, dest_table_id=dest_table_id, output=output, wait=False,
+            **kwargs)
+        rows = await self.wait_for_job_async(job)
+        self.logger.info(f"Completed query job {job.job_id}")
+        if dest_table_id is not None:
+            return
+        return await self._run_in_executor(self._convert_rows, rows, output.lower())
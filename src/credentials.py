@@ -0,0 +1,57 @@
+# Credentials come from a service account key in "./service_account_key.json" if it
+# exists, otherwise from Application Default Credentials.
+
+import os
+import threading
+import google.auth
+from google.oauth2 import service_account
+
+
+DEFAULT_KEY_PATH = './service_account_key.json'
+CLOUD_PLATFORM_SCOPES = ("https://www.googleapis.com/auth/cloud-platform",)
+
+# credentials shared across all helper objects, keyed by (key_path, scopes)
+_CRED_CACHE: dict = {}
+_CRED_LOCK = threading.Lock()
+
+
+def get_credentials(key_path=DEFAULT_KEY_PATH, scopes=CLOUD_PLATFORM_SCOPES):
+    """
+    Get service account credentials, parsing the key file only once.
+
+    If there is no key file at key_path, Application Default Credentials are used
+    instead (e.g. the attached service account when running on GCE, GKE, Cloud Run
+    or Cloud Functions, or the credentials set up by `gcloud auth`).
+
+    The same credentials object is returned for every call with the same key_path
+    and scopes. The underlying google.auth transport refreshes its token in-place,
+    so it can be shared for the lifetime of the process.
+
+    Parameters
+    ----------
+    key_path : str, optional (default: './service_account_key.json')
+        Path to the service account key file
+    scopes : tuple of str, optional (default: cloud-platform scope)
+        OAuth scopes for the credentials, or None for no scopes
+    """
+
+    if scopes is not None:
+        scopes = tuple(scopes)
+    with _CRED_LOCK:
+        credentials = _CRED_CACHE.get((key_path, scopes))
+        if credentials is None:
+            scope_list = list(scopes) if scopes is not None else None
+            if os.path.exists(key_path):
+                credentials = service_account.Credentials.from_service_account_file(
+                    key_path, scopes=scope_list)
+            else:
+                credentials, _ = google.auth.default(scopes=scope_list)
+            _CRED_CACHE[(key_path, scopes)] = credentials
+        return credentials
+
+
+def clear_credentials_cache():
+    """Clear the shared credentials cache (e.g. for tests)."""
+
+    with _CRED_LOCK:
+        _CRED_CACHE.clear()
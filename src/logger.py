@@ -1,7 +1,13 @@
 import logging
+import threading
 import google.cloud.logging
 from google.cloud.logging_v2.handlers import CloudLoggingHandler
-from google.oauth2 import service_account
+from src.credentials import DEFAULT_KEY_PATH, get_credentials
+
+
+# logging clients shared across Logger instances, keyed by project_id
+_CLIENT_CACHE: dict = {}
+_CLIENT_LOCK = threading.Lock()
 
 
 class Logger():
@@ -10,11 +16,13 @@ class Logger():
 
         self.project_id = project_id
 
-        # pass service account key into credentials
-        key_path = './service_account_key.json'
-        credentials = service_account.Credentials.from_service_account_file(key_path)
-        self.client = google.cloud.logging.Client(credentials=credentials,
-                                                  project=project_id)
+        # pass service account key into credentials, and reuse one client per project
+        credentials = get_credentials(DEFAULT_KEY_PATH, scopes=None)
+        with _CLIENT_LOCK:
+            if project_id not in _CLIENT_CACHE:
+                _CLIENT_CACHE[project_id] = google.cloud.logging.Client(
+                    credentials=credentials, project=project_id)
+            self.client = _CLIENT_CACHE[project_id]
 
         self.logger = logging.getLogger('cloudLogger')
         self.logger.setLevel(logging.INFO)
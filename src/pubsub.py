@@ -1,16 +1,39 @@
-import time
+import asyncio
+import functools
+import sys
+import threading
+from collections import deque
 from concurrent import futures
 from typing import Callable
-from google.oauth2 import service_account
 from google.api_core.exceptions import NotFound
 from google.cloud import pubsub_v1
+from google.pubsub_v1 import PublisherAsyncClient, PubsubMessage
+from src.credentials import DEFAULT_KEY_PATH, CLOUD_PLATFORM_SCOPES, get_credentials
 from src.logger import Logger
 
 
+# publisher and subscriber clients shared across PubSub instances, keyed by
+# id(credentials)
+_PUBLISHER_CACHE: dict = {}
+_SUBSCRIBER_CACHE: dict = {}
+_CLIENT_LOCK = threading.Lock()
+
+_ASYNC_PUBLISH_CHUNK_SIZE = 100  # messages per publish request in publish_many_async
+
+
+@functools.lru_cache(maxsize=128)
+def _encode(message, encoding):
+    """Encode a str message, memoized for PubSub.prepare."""
+
+    return message.encode(encoding)
+
+
 class PubSub():
     """Google Cloud Pub/Sub API helper class"""
 
-    def __init__(self, project_id, topic_id, subscription_id=None, logger=None):
+    def __init__(self, project_id, topic_id, subscription_id=None, logger=None,
+                 debug=False, max_messages=100, max_bytes=1_000_000, max_latency=0.01,
+                 subscribe_max_messages=1000, subscribe_max_bytes=100 * 1024 * 1024):
         """
         Initialize the PubSub class.
 
@@ -26,20 +49,32 @@ class PubSub():
             Logger object
             Passing the logger explicitly prevents duplicate logging if multiple
             PubSub objects are instantiated at the same time in parallel.
+        debug : bool
+            Log every received message (off by default since it's slow for
+            high-volume subscriptions)
+        max_messages : int, optional (default: 100)
+            Maximum number of messages the publisher client sends in one batch
+        max_bytes : int, optional (default: 1000000)
+            Maximum total size (bytes) of a batch
+        max_latency : float, optional (default: 0.01)
+            Maximum time (seconds) a message waits for its batch to fill before
+            the batch is sent
+        subscribe_max_messages : int, optional (default: 1000)
+            Maximum number of received messages subscribe holds unacknowledged
+            at once
+        subscribe_max_bytes : int, optional (default: 100 MiB)
+            Maximum total size (bytes) of the messages subscribe holds
+            unacknowledged at once
         """
 
         # pass service account key into credentials
-        key_path = './service_account_key.json'
-        credentials = service_account.Credentials.from_service_account_file(
-            key_path,
-            scopes=["https://www.googleapis.com/auth/cloud-platform"],
-        )
+        credentials = get_credentials(DEFAULT_KEY_PATH, CLOUD_PLATFORM_SCOPES)
 
         # Configure batch settings for the publisher client.
         batch_settings = pubsub_v1.types.BatchSettings(
-            max_messages=100,  # default 100
-            max_bytes=1000000,  # default 1000000 (~1 MB)
-            max_latency=1,  # default 0.01 (seconds) (10 ms)
+            max_messages=max_messages,
+            max_bytes=max_bytes,
+            max_latency=max_latency,
         )
 
         # Configure how many messages the publisher client can hold in memory
@@ -50,27 +85,45 @@ class PubSub():
             limit_exceeded_behavior=pubsub_v1.types.LimitExceededBehavior.BLOCK,
         )
 
-        # Create a Publisher client.
-        self.publisher = pubsub_v1.PublisherClient(
-            batch_settings=batch_settings,
-            publisher_options=pubsub_v1.types.PublisherOptions(
-                flow_control=flow_control_settings),
-            credentials=credentials
-        )
-
-        # Create a Subscriber client.
-        self.subscriber = pubsub_v1.SubscriberClient(credentials=credentials)
+        # Create Publisher and Subscriber clients (or reuse the ones already created
+        # for these credentials and batch settings, along with their gRPC channels).
+        publisher_key = (id(credentials), max_messages, max_bytes, max_latency)
+        with _CLIENT_LOCK:
+            if publisher_key not in _PUBLISHER_CACHE:
+                _PUBLISHER_CACHE[publisher_key] = pubsub_v1.PublisherClient(
+                    batch_settings=batch_settings,
+                    publisher_options=pubsub_v1.types.PublisherOptions(
+                        flow_control=flow_control_settings),
+                    credentials=credentials
+                )
+            if id(credentials) not in _SUBSCRIBER_CACHE:
+                _SUBSCRIBER_CACHE[id(credentials)] = pubsub_v1.SubscriberClient(
+                    credentials=credentials)
+            self.publisher = _PUBLISHER_CACHE[publisher_key]
+            self.subscriber = _SUBSCRIBER_CACHE[id(credentials)]
 
         # set attributes
+        self.credentials = credentials
+        # (event loop, asyncio publisher client), created on first use in each loop
+        self._async_publisher = None
         self.project_id = project_id
         self.project_path = f"projects/{project_id}"
         self.topic_path = self.publisher.topic_path(self.project_id, topic_id)
+        self._list_subs_request = pubsub_v1.types.ListTopicSubscriptionsRequest(
+            topic=self.topic_path)
         if subscription_id:
             self.subscription_path = self.subscriber.subscription_path(self.project_id,
                                                                        subscription_id)
         self.publish_exception_count = 0
-        self.futures = dict()
-        self.received_messages = []
+        self.futures = set()  # futures of messages that haven't finished publishing
+        self._failed_futures = set()  # failed futures not yet reported by flush
+        self._futures_lock = threading.Lock()
+        self.subscribe_max_messages = subscribe_max_messages
+        self.subscribe_max_bytes = subscribe_max_bytes
+        # raw message data, decoded by subscribe (not bounded, since messages are
+        # acked as they arrive; subscriber flow control limits how fast it grows)
+        self.received_messages = deque()
+        self.debug = debug
         self.encoding = "utf-8"
 
         # set up logger
@@ -139,22 +192,20 @@ class PubSub():
         self.logger.info(f"Listing all topics in project {self.project_id}")
         request = pubsub_v1.types.ListTopicsRequest(project=self.project_path)
         page_result = self.publisher.list_topics(request=request)
-        for response in page_result:
-            print(response)
+        sys.stdout.writelines(f"{response}\n" for response in page_result)
 
     def list_topic_subscriptions(self):
         """List all subscriptions for the current topic."""
 
         self.logger.info(f"Listing all subscriptions in topic {self.topic_path}")
-        request = pubsub_v1.types.ListTopicSubscriptionsRequest(topic=self.topic_path)
         try:
-            page_result = self.publisher.list_topic_subscriptions(request=request)
+            page_result = self.publisher.list_topic_subscriptions(
+                request=self._list_subs_request)
         except NotFound:
-            msg = f"Topic {self.topic} not found in project {self.project_id}"
+            msg = f"Topic {self.topic_path} not found in project {self.project_id}"
             self.logger.warning(msg)
             return
-        for response in page_result:
-            print(response)
+        sys.stdout.writelines(f"{response}\n" for response in page_result)
 
     def list_subscriptions(self):
         """List all subscriptions in the current project."""
@@ -162,47 +213,236 @@ class PubSub():
         self.logger.info(f"Listing all subscriptions in project {self.project_id}")
         request = pubsub_v1.types.ListSubscriptionsRequest(project=self.project_path)
         page_result = self.subscriber.list_subscriptions(request=request)
-        for response in page_result:
-            print(response)
+        sys.stdout.writelines(f"{response}\n" for response in page_result)
 
     def publish(self, message):
         """
-        Publish a message to the current topic.
+        Publish a message to the current topic, without waiting for it to be sent.
+
+        The publisher client batches messages, so publishing many messages before
+        waiting on any of them sends far fewer requests than waiting on each one.
+        The future is tracked in self.futures until it completes, so
+        wait_for_publish_to_finish can wait on everything published so far.
 
         Parameters
         ----------
-        message : str
-            Message to publish
+        message : bytes or str
+            Message to publish (str messages are encoded with self.encoding, via
+            publish_str)
+
+        Returns
+        -------
+        google.cloud.pubsub_v1.publisher.futures.Future
+            Future for the publish request, or None if it couldn't be submitted.
         """
 
+        # the client only accepts byte strings
+        if type(message) is str:
+            return self.publish_str(message)
         try:
-            if self.encoding:
-                message = message.encode(self.encoding)  # messages must be byte strings
             future = self.publisher.publish(self.topic_path, message)
         except Exception as e:
             self.publish_exception_count += 1
             self.logger.warning(f"issue publishing message: {message}, exception: {e}")
-        future.result()
+            return
+        self.futures.add(future)
+        future.add_done_callback(self._track_publish)
+        return future
 
-    def publish_with_callback(self, message):
+    def publish_str(self, message):
         """
-        Publish a message to the current topic with a callback.
+        Encode a message with self.encoding and publish it to the current topic.
 
         Parameters
         ----------
         message : str
             Message to publish
+
+        Returns
+        -------
+        google.cloud.pubsub_v1.publisher.futures.Future
+            Future for the publish request, or None if it couldn't be submitted.
+        """
+
+        return self.publish(message.encode(self.encoding))
+
+    def prepare(self, message):
+        """
+        Encode a message once, for publishing it many times (e.g. heartbeats).
+
+        The encoded bytes of the 128 most recently prepared messages are cached, so
+        this is meant for a small set of repeated payloads, not every message.
+
+        Parameters
+        ----------
+        message : str
+            Message to encode
+
+        Returns
+        -------
+        bytes
+            The message encoded with self.encoding, ready to pass to publish.
+        """
+
+        return _encode(message, self.encoding)
+
+    def publish_sync(self, message):
+        """
+        Publish a message to the current topic and wait for it to be sent.
+
+        Parameters
+        ----------
+        message : str or bytes
+            Message to publish
+        """
+
+        future = self.publish(message)
+        if future is not None:
+            future.result()
+
+    def publish_many(self, messages):
+        """
+        Publish many messages to the current topic and wait for them all to be sent.
+
+        Parameters
+        ----------
+        messages : list of str or bytes
+            Messages to publish
+
+        Returns
+        -------
+        list of google.cloud.pubsub_v1.publisher.futures.Future
+            Futures for the publish requests that were submitted.
+        """
+
+        # hoist attribute lookups out of the loop
+        publish, topic_path, encoding = self.publisher.publish, self.topic_path, self.encoding
+        publish_futures = []
+        append = publish_futures.append
+        for message in messages:
+            if not isinstance(message, bytes):
+                message = message.encode(encoding)
+            try:
+                append(publish(topic_path, message))
+            except Exception as e:
+                self.publish_exception_count += 1
+                self.logger.warning(f"issue publishing message: {message}, exception: {e}")
+        futures.wait(publish_futures, return_when=futures.ALL_COMPLETED)
+        for future in publish_futures:
+            if future.exception() is not None:
+                self.publish_exception_count += 1
+                self.logger.warning(f"issue publishing message, exception: "
+                                    f"{future.exception()}")
+        return publish_futures
+
+    def _get_async_publisher(self):
+        """
+        Get the asyncio publisher client for the running event loop.
+
+        The client's gRPC channel is bound to the loop it was created in, so a new
+        client is created whenever the running loop changes (e.g. when asyncio.run
+        is called once per batch).
+        """
+
+        loop = asyncio.get_running_loop()
+        if self._async_publisher is None or self._async_publisher[0] is not loop:
+            self._async_publisher = (loop, PublisherAsyncClient(credentials=self.credentials))
+        return self._async_publisher[1]
+
+    async def publish_async(self, message):
+        """
+        Publish a message to the current topic from a running event loop.
+
+        Unlike publish, this sends its own request rather than going through the
+        publisher client's batching thread, so concurrent producers can await
+        asyncio.gather(*[pubsub.publish_async(m) for m in messages]).
+
+        Parameters
+        ----------
+        message : str or bytes
+            Message to publish (str messages are encoded with self.encoding)
+
+        Returns
+        -------
+        str
+            The server-assigned message ID.
+        """
+
+        message_ids = await self._publish_chunk_async([message])
+        return message_ids[0]
+
+    async def publish_many_async(self, messages):
+        """
+        Publish many messages to the current topic from a running event loop.
+
+        Messages are sent in chunks of 100 per request, with the chunks published
+        concurrently.
+
+        Parameters
+        ----------
+        messages : list of str or bytes
+            Messages to publish (str messages are encoded with self.encoding)
+
+        Returns
+        -------
+        list of str
+            The server-assigned message IDs, in the same order as messages.
         """
 
+        size = _ASYNC_PUBLISH_CHUNK_SIZE
+        chunks = [messages[i:i + size] for i in range(0, len(messages), size)]
+        results = await asyncio.gather(*[self._publish_chunk_async(c) for c in chunks])
+        return [message_id for message_ids in results for message_id in message_ids]
+
+    async def _publish_chunk_async(self, messages):
+        """
+        Publish a list of messages in a single request.
+
+        Parameters
+        ----------
+        messages : list of str or bytes
+            Messages to publish
+
+        Returns
+        -------
+        list of str
+            The server-assigned message IDs.
+        """
+
+        encoding = self.encoding
+        pubsub_messages = [
+            PubsubMessage(data=m if isinstance(m, bytes) else m.encode(encoding))
+            for m in messages]
         try:
-            if self.encoding:
-                message = message.encode(self.encoding)  # messages must be byte strings
-            future = self.publisher.publish(self.topic_path, message)
-            self.futures[message] = future
+            response = await self._get_async_publisher().publish(
+                topic=self.topic_path, messages=pubsub_messages)
+        except Exception as e:
+            self.publish_exception_count += len(messages)
+            self.logger.warning(f"issue publishing {len(messages)} messages, "
+                                f"exception: {e}")
+            raise
+        return list(response.message_ids)
+
+    def publish_with_callback(self, message):
+        """
+        Publish a message to the current topic with a callback.
+
+        Parameters
+        ----------
+        message : str or bytes
+            Message to publish (str messages are encoded with self.encoding)
+        """
+
+        # messages must be byte strings
+        data = message if isinstance(message, bytes) else message.encode(self.encoding)
+        try:
+            future = self.publisher.publish(self.topic_path, data)
         except Exception as e:
             self.publish_exception_count += 1
             self.logger.warning(f"issue publishing message: {message}, exception: {e}")
-        future.add_done_callback(self.get_callback(future, message))
+            return
+        self.futures.add(future)
+        future.add_done_callback(functools.partial(self._on_publish_done, data))
 
     def subscribe(self, timeout=10):
         """
@@ -217,17 +457,60 @@ class PubSub():
         """
 
         self.logger.info(f"Subscribing to topic: {self.topic_path}")
+        # limit how many messages the server streams before earlier ones are acked
+        flow_control = pubsub_v1.types.FlowControl(max_messages=self.subscribe_max_messages,
+                                                   max_bytes=self.subscribe_max_bytes)
         future = self.subscriber.subscribe(self.subscription_path,
-                                           callback=self.subscriber_callback)
+                                           callback=self.subscriber_callback,
+                                           flow_control=flow_control)
 
-        # Wrap subscriber in a 'with' block to automatically call close() when done.
-        with self.subscriber:
-            try:
-                future.result(timeout=timeout)
-            except (KeyboardInterrupt, futures._base.TimeoutError):
-                future.cancel()  # Trigger the shutdown.
-                future.result()  # Block until the shutdown is complete.
-        return self.received_messages
+        # The subscriber client is shared, so only the streaming pull is shut down
+        # when done (rather than closing the client).
+        try:
+            future.result(timeout=timeout)
+        except (KeyboardInterrupt, futures._base.TimeoutError):
+            future.cancel()  # Trigger the shutdown.
+            future.result()  # Block until the shutdown is complete.
+        encoding = self.encoding
+        return [data.decode(encoding) for data in self.received_messages]
+
+    def pull_batch(self, max_messages=1000, timeout=10):
+        """
+        Pull a batch of messages from the current subscription and acknowledge them.
+
+        Unlike subscribe, messages are fetched and acknowledged in one request each,
+        which is much cheaper per message when draining a backlog.
+
+        Parameters
+        ----------
+        max_messages : int
+            Maximum number of messages to pull
+        timeout : int
+            Timeout in seconds for the pull request
+
+        Returns
+        -------
+        list of str
+            The pulled messages, decoded with self.encoding.
+        """
+
+        self.logger.info(f"Pulling up to {max_messages} messages from "
+                         f"{self.subscription_path}")
+        response = self.subscriber.pull(
+            request={"subscription": self.subscription_path,
+                     "max_messages": max_messages},
+            timeout=timeout,
+        )
+        received = response.received_messages
+        if not received:
+            return []
+        messages = [m.message.data.decode(self.encoding) for m in received]
+        self.subscriber.acknowledge(
+            request={"subscription": self.subscription_path,
+                     "ack_ids": [m.ack_id for m in received]}
+        )
+        self.logger.info(f"Pulled and acknowledged {len(messages)} messages")
+        return messages
 
     def subscriber_callback(self, message):
         """
@@ -239,9 +522,10 @@ class PubSub():
             Message received from the subscriber
         """
 
-        data = message.data.decode(self.encoding)
-        self.logger.info(f"Received message: {data}")
-        self.received_messages.append(data)
+        # decoding is deferred to subscribe, to keep the callback cheap
+        if self.debug:
+            self.logger.info(f"Received message: {message.data.decode(self.encoding)}")
+        self.received_messages.append(message.data)
         message.ack()
 
     def get_callback(self,
@@ -254,45 +538,119 @@ class PubSub():
         Parameters
         ----------
         future : google.cloud.pubsub_v1.publisher.futures.Future
-            Future object
+            Future object (unused, kept for backwards compatibility)
         message : str
             Message to publish
         """
 
-        def callback(future: pubsub_v1.publisher.futures.Future = future) -> None:
-            """
-            Handle the result of the publish request.
+        return functools.partial(self._on_publish_done, message)
 
-            Parameters
-            ----------
-            future : google.cloud.pubsub_v1.publisher.futures.Future
-                Future object
-            """
-            try:
-                # Wait 60 seconds for the publish call to succeed.
-                future.result(timeout=60)
-            except futures.TimeoutError:
-                self.logger.warning(f"Publishing {message} timed out.")
-            except Exception as e:
-                self.logger.warning(f"Publishing {message} failed with an exception: {e}")
-            self.futures.pop(message)
-        return callback
+    def _on_publish_done(self, message, future: pubsub_v1.publisher.futures.Future) -> None:
+        """
+        Handle the result of the publish request.
+
+        Parameters
+        ----------
+        message : str or bytes
+            Message that was published
+        future : google.cloud.pubsub_v1.publisher.futures.Future
+            Future object
+        """
+
+        self._track_publish(future, message)
+
+    def _track_publish(self, future, message=None):
+        """
+        Stop tracking a finished publish, counting and logging it if it failed.
+
+        Parameters
+        ----------
+        future : google.cloud.pubsub_v1.publisher.futures.Future
+            Finished future for the publish request
+        message : str or bytes, optional (default: None)
+            Message that was published, to include in the log
+        """
+
+        exception = future.exception()
+        with self._futures_lock:
+            # futures already collected by flush are reported there, not here
+            tracked = future in self.futures
+            self.futures.discard(future)
+            if exception is not None:
+                self.publish_exception_count += 1
+                if tracked:
+                    self._failed_futures.add(future)
+        if exception is not None:
+            if message is None:
+                self.logger.warning(f"issue publishing message, exception: {exception}")
+            else:
+                self.logger.warning(f"Publishing {message} failed with an exception: "
+                                    f"{exception}")
+
+    def _wait_for_futures(self, timeout=None):
+        """
+        Wait for the messages published so far, and collect the ones that failed.
+
+        Parameters
+        ----------
+        timeout : float, optional (default: None)
+            Maximum time in seconds to wait, or None to wait indefinitely
+
+        Returns
+        -------
+        tuple
+            (number of messages that failed since the last call, set of futures
+            that still hadn't completed)
+        """
+
+        done, not_done = futures.wait(list(self.futures), timeout=timeout,
+                                      return_when=futures.ALL_COMPLETED)
+        with self._futures_lock:
+            # done callbacks may not have run yet, so check the futures directly too
+            self.futures.difference_update(done)
+            failed = self._failed_futures.union(
+                f for f in done if f.exception() is not None)
+            self._failed_futures.clear()
+        if failed:
+            self.logger.warning(f"{len(failed)} messages failed to publish")
+        return len(failed), not_done
+
+    def flush(self):
+        """
+        Wait for every message published so far to finish publishing.
+
+        Returns
+        -------
+        int
+            Number of messages that failed to publish since the last flush
+            (including ones that failed before flush was called).
+        """
+
+        failed, _ = self._wait_for_futures()
+        return failed
 
     def wait_for_publish_to_finish(self, min_delay=5, max_delay=30*60):
         """
         Wait for all published messages to be acknowledged by the server.
 
+        Returns as soon as the last pending publish completes (or max_delay passes).
+
         Parameters
         ----------
         min_delay : int
-            Minimum delay in seconds
+            Unused, kept for backwards compatibility
         max_delay : int
             Maximum delay in seconds
+
+        Returns
+        -------
+        int
+            Number of publishes that still hadn't completed after max_delay.
         """
 
         self.logger.info("waiting for publishing to finish...")
-        time.sleep(min_delay)
-        total_delay = min_delay
-        while self.futures and total_delay < max_delay:
-            time.sleep(5)
-            total_delay += 5
+        _, not_done = self._wait_for_futures(timeout=max_delay)
+        if not_done:
+            self.logger.warning(f"{len(not_done)} messages not published after "
+                                f"{max_delay} seconds")
+        return len(not_done)
@@ -1,13 +1,34 @@
-# TODO(user): Need to provide service account key in "./service_account_key.json"
-
-from google.cloud import storage
-from google.oauth2 import service_account
-from glob import glob
+import mimetypes
 import os
-from pathlib import Path
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from operator import attrgetter
+from google.api_core.exceptions import NotFound
+from google.cloud import storage
+from src.credentials import DEFAULT_KEY_PATH, CLOUD_PLATFORM_SCOPES, get_credentials
 from src.logger import Logger
 
 
+_UPLOAD_WORKERS = 16  # concurrent uploads in upload_dir_recursive and upload_file
+
+# files larger than this are uploaded as parallel components that are then
+# composed into the destination blob (compose accepts at most 32 components)
+_COMPOSITE_UPLOAD_THRESHOLD = 32 * 1024 * 1024  # 32 MiB
+_MIN_COMPONENT_SIZE = 8 * 1024 * 1024  # 8 MiB, also used as the upload chunk size
+_MAX_COMPOSE_COMPONENTS = 32
+
+# blobs at least this large are downloaded as concurrent byte-range requests
+_CHUNKED_DOWNLOAD_THRESHOLD = 32 * 1024 * 1024  # 32 MiB
+_DOWNLOAD_CHUNK_SIZE = 32 * 1024 * 1024  # 32 MiB
+_DOWNLOAD_WORKERS = 8
+
+# storage clients shared across Storage instances, keyed by
+# (project_id, id(credentials))
+_CLIENT_CACHE: dict = {}
+_CLIENT_LOCK = threading.Lock()
+
+
 class Storage():
     """Google Cloud Storage API helper class"""
 
@@ -32,12 +53,16 @@ class Storage():
         self.__dict__.update({k: v for k, v in kwargs.items() if k in _kws})
 
         # pass service account key into credentials
-        key_path = './service_account_key.json'
-        credentials = service_account.Credentials.from_service_account_file(
-            key_path,
-            scopes=["https://www.googleapis.com/auth/cloud-platform"],
-        )
-        self.client = storage.Client(credentials=credentials, project=self.project_id)
+        credentials = get_credentials(DEFAULT_KEY_PATH, CLOUD_PLATFORM_SCOPES)
+
+        # create the client (or reuse the one already created for this project and
+        # these credentials, along with its HTTP connection pool)
+        client_key = (self.project_id, id(credentials))
+        with _CLIENT_LOCK:
+            if client_key not in _CLIENT_CACHE:
+                _CLIENT_CACHE[client_key] = storage.Client(credentials=credentials,
+                                                           project=self.project_id)
+            self.client = _CLIENT_CACHE[client_key]
         self.bucket = self.client.bucket(self.bucket_name)
 
         # set up logger
@@ -58,8 +83,21 @@ class Storage():
             downloaded, e.g. "./my_file_path.txt".
         """
 
-        blob = self.bucket.blob(gcs_src_path)
-        blob.download_to_filename(local_dest_path)
+        # fetch the blob's metadata, to decide how to download it from its size
+        blob = self.bucket.get_blob(gcs_src_path)
+        if blob is None:
+            raise NotFound(f"Blob {gcs_src_path} not found in bucket {self.bucket_name}")
+        if blob.size >= _CHUNKED_DOWNLOAD_THRESHOLD:
+            # imported here, since importing it warns that it's a preview feature
+            from google.cloud.storage import transfer_manager
+
+            # download byte ranges in parallel into the local file (threads rather
+            # than the default processes, so the shared client is reused)
+            transfer_manager.download_chunks_concurrently(
+                blob, local_dest_path, chunk_size=_DOWNLOAD_CHUNK_SIZE,
+                max_workers=_DOWNLOAD_WORKERS, worker_type=transfer_manager.THREAD)
+        else:
+            blob.download_to_filename(local_dest_path)
         self.logger.info(f"Blob {gcs_src_path} downloaded to {local_dest_path}.")
 
     def upload_file(self, local_src_path, gcs_dest_path):
@@ -77,12 +115,65 @@ class Storage():
 
         blob = self.bucket.blob(gcs_dest_path)
         self.logger.info(f"Uploading {local_src_path} to {gcs_dest_path}...")
-        blob.upload_from_filename(local_src_path)
+        size = os.path.getsize(local_src_path)
+        if size > _COMPOSITE_UPLOAD_THRESHOLD:
+            self._upload_composite(local_src_path, blob, size)
+        else:
+            blob.upload_from_filename(local_src_path)
 
-    def upload_dir_recursive(self, local_src_dir, gcs_dest_dir):
+    def _upload_composite(self, local_src_path, blob, size):
+        """
+        Uploads a large file as parallel components composed into a single blob.
+
+        The temporary component blobs (named "<blob name>.<random hex>.part<i>") are
+        deleted afterwards, whether or not the upload succeeds.
+
+        Parameters
+        ----------
+        local_src_path : str
+            The path to the local file to upload.
+        blob : google.cloud.storage.blob.Blob
+            The destination blob.
+        size : int
+            The size of the file in bytes.
+        """
+
+        n_parts = min(_MAX_COMPOSE_COMPONENTS, -(-size // _MIN_COMPONENT_SIZE))
+        part_size = -(-size // n_parts)
+        # give the components a unique prefix, so existing blobs aren't overwritten
+        part_prefix = f"{blob.name}.{uuid.uuid4().hex}"
+        parts = [self.bucket.blob(f"{part_prefix}.part{i}", chunk_size=_MIN_COMPONENT_SIZE)
+                 for i in range(n_parts)]
+
+        def upload_part(i):
+            offset = i * part_size
+            with open(local_src_path, 'rb') as f:
+                f.seek(offset)
+                parts[i].upload_from_file(f, size=min(part_size, size - offset))
+
+        try:
+            with ThreadPoolExecutor(max_workers=min(n_parts, _UPLOAD_WORKERS)) as executor:
+                list(executor.map(upload_part, range(n_parts)))
+            # compose doesn't carry over a content type, so set it like
+            # upload_from_filename would
+            if blob.content_type is None:
+                blob.content_type = (mimetypes.guess_type(local_src_path)[0]
+                                     or 'application/octet-stream')
+            blob.compose(parts)
+        finally:
+            # parts that were never uploaded are ignored
+            self.bucket.delete_blobs(parts, on_error=lambda part: None)
+
+    def upload_dir_recursive(self, local_src_dir, gcs_dest_dir,
+                             max_workers=_UPLOAD_WORKERS):
         """
         Uploads a directory recursively to the bucket.
 
+        Files keep their path relative to the directory's parent, so
+        "./my_dir/a/b.txt" is uploaded to "{gcs_dest_dir}/my_dir/a/b.txt".
+        Small files are uploaded concurrently by the storage transfer manager,
+        and large files are uploaded one at a time as parallel composite uploads.
+
         Parameters
         ----------
         local_src_dir : str
@@ -90,23 +181,35 @@ class Storage():
         gcs_dest_dir : str
             The path to the directory to upload to, not including the project or
             bucket name, e.g. "my_dir".
+        max_workers : int, optional (default: 16)
+            Maximum number of files to upload at the same time.
         """
 
-        files_and_dirs = glob(f"{local_src_dir}/*")
-        for file_or_dir in files_and_dirs:
-            name = Path(file_or_dir).name
-            parent_name = Path(file_or_dir).parent.name
-
-            # directory case
-            if os.path.isdir(file_or_dir):
-                src_subdir = f"{local_src_dir}/{name}"
-                dest_subdir = f"{gcs_dest_dir}/{parent_name}"
-                self.upload_dir_recursive(src_subdir, dest_subdir)
-
-            # file case
-            else:
-                dest = f"{gcs_dest_dir}/{parent_name}/{name}"
-                self.upload_file(file_or_dir, dest)
+        local_src_dir = os.path.normpath(local_src_dir)
+        dest_root = f"{gcs_dest_dir}/{os.path.basename(local_src_dir)}"
+        small_files, large_files = [], []
+        for root, _, files in os.walk(local_src_dir):
+            for name in files:
+                local_path = os.path.join(root, name)
+                rel_path = os.path.relpath(local_path, local_src_dir).replace(os.sep, '/')
+                if os.path.getsize(local_path) > _COMPOSITE_UPLOAD_THRESHOLD:
+                    large_files.append((local_path, f"{dest_root}/{rel_path}"))
+                else:
+                    small_files.append(rel_path)
+
+        self.logger.info(f"Uploading {len(small_files) + len(large_files)} files from "
+                         f"{local_src_dir} to {dest_root}...")
+        if small_files:
+            # imported here, since importing it warns that it's a preview feature
+            from google.cloud.storage import transfer_manager
+
+            # threads rather than the default processes, so the shared client is reused
+            transfer_manager.upload_many_from_filenames(
+                self.bucket, small_files, source_directory=local_src_dir,
+                blob_name_prefix=f"{dest_root}/", max_workers=max_workers,
+                worker_type=transfer_manager.THREAD, raise_exception=True)
+        for local_path, gcs_path in large_files:
+            self.upload_file(local_path, gcs_path)
 
     def list_blobs(self, prefix=None, delimiter=None):
         """
@@ -132,5 +235,7 @@ class Storage():
         """
 
         self.logger.info(f"Getting list of blobs with prefix {prefix}")
-        blobs = self.bucket.list_blobs(prefix=prefix, delimiter=delimiter)
-        return [b.name for b in blobs]
+        # only request the fields we use, rather than the full metadata of every blob
+        blobs = self.client.list_blobs(self.bucket, prefix=prefix, delimiter=delimiter,
+                                       fields='items(name),nextPageToken,prefixes')
+        return list(map(attrgetter('name'), blobs))